@@ -1,157 +1,320 @@
+import os
 import psycopg
+from psycopg import sql
+from psycopg_pool import ConnectionPool
 from databricks.sdk import WorkspaceClient
 import uuid
 import streamlit as st
 import datetime
+import threading
+import time
 import pandas as pd
 
 CATALOG_NAME = "pet_data"
 SCHEMA_NAME = "public"
 TABLE_NAME = "pet_records"
 INSTANCE_NAME = "lakebase-app-demo-instance"
+PAGE_SIZE = 50
+RECORDS_TTL_SECONDS = 30
+
+# Set LAKEBASE_POOLER_PORT to route app queries through a transaction-mode
+# pooler (e.g. PgBouncer on 6432). DDL always uses the direct session port.
+DB_PORT = int(os.environ.get("LAKEBASE_PORT", "5432"))
+POOLER_PORT = os.environ.get("LAKEBASE_POOLER_PORT")
+APPLICATION_NAME = "banfield_intake"
+# Named prepared statements don't survive transaction pooling, so only use them direct
+PREPARE_STATEMENTS = POOLER_PORT is None
+
+_CONNECT_KWARGS = {
+    "dbname": "databricks_postgres",
+    "sslmode": "require",
+    "application_name": APPLICATION_NAME,
+}
+
+INTAKE_FIELDS = (
+    "full_name",
+    "date_of_birth",
+    "phone",
+    "email",
+    "address",
+    "visit_date",
+    "department",
+    "symptoms",
+    "allergies",
+    "additional_notes",
+)
+RECORD_COLUMNS = ("id", "full_name", "pet_id", *INTAKE_FIELDS[1:], "created_at")
+REQUIRED_CSV_COLUMNS = ("full_name", "date_of_birth")
+
+
+@st.cache_resource(ttl=45 * 60, show_spinner=False)
+def _connection_params() -> dict:
+    """Look up the Lakebase host and mint a temporary credential via the Databricks SDK.
+
+    Shared across sessions and refreshed before the one-hour token expires, so
+    new connections don't each cost several control-plane calls.
+    """
+    # Initialize the Databricks SDK WorkspaceClient
+    w = WorkspaceClient()
 
+    # Obtain a temporary connection credential
+    cred = w.database.generate_database_credential(
+        request_id=str(uuid.uuid4()),
+        instance_names=[INSTANCE_NAME]
+    )
+
+    current_user = w.current_user.me().user_name
+    instance = w.database.get_database_instance(name=INSTANCE_NAME)
+
+    return {
+        "host": instance.read_write_dns,
+        "user": current_user,
+        "password": cred.token,
+    }
 
-def _get_connection():
-    """Initialize connection to Lakebase using Databricks SDK."""
-    if "db_conn" not in st.session_state:
-        # Initialize the Databricks SDK WorkspaceClient
-        w = WorkspaceClient()
-        
-        # Obtain a temporary connection credential
-        cred = w.database.generate_database_credential(
-            request_id=str(uuid.uuid4()),
-            instance_names=[INSTANCE_NAME]
-        )
-        
-        current_user = w.current_user.me().user_name
-        instance = w.database.get_database_instance(name=INSTANCE_NAME)
-        
-        # Connection parameters
-        st.session_state.db_conn = psycopg.connect(
-            host=instance.read_write_dns,
-            dbname="databricks_postgres",
-            user=current_user,
-            password=cred.token,
-            sslmode="require"
-        )
-    
-    return st.session_state.db_conn
 
+class _LakebaseConnection(psycopg.Connection):
+    """Connection that takes its host, user and token from the shared cached parameters on open."""
 
-def _qualified_table_name() -> str:
-    return f'"{SCHEMA_NAME}"."{TABLE_NAME}"'
+    @classmethod
+    def connect(cls, conninfo: str = "", **kwargs):
+        kwargs.update(_connection_params())
+        return super().connect(conninfo, **kwargs)
 
 
-def _generate_pet_id() -> str:
-    return f"PET-{uuid.uuid4().hex[:10].upper()}"
+@st.cache_resource(show_spinner=False)
+def _get_pool() -> ConnectionPool:
+    """Create the Lakebase connection pool once and share it across reruns and sessions."""
+    _create_schema_and_table()
+    return ConnectionPool(
+        kwargs={
+            **_CONNECT_KWARGS,
+            "port": int(POOLER_PORT or DB_PORT),
+            "prepare_threshold": 5 if PREPARE_STATEMENTS else None,
+        },
+        connection_class=_LakebaseConnection,
+        # Sessions run on separate script threads and share this pool concurrently
+        min_size=2,
+        max_size=10,
+        max_lifetime=30 * 60,  # Re-establish periodically, e.g. to follow instance failover
+        check=ConnectionPool.check_connection,
+        open=True,
+    )
+
+
+# CATALOG_NAME is the Unity Catalog name for this database; inside Postgres the
+# table is addressed as schema.table on the connected database.
+_TABLE = sql.Identifier(SCHEMA_NAME, TABLE_NAME)
+_QTABLE = _TABLE.as_string()  # For the DDL f-strings below
+
+# Pet IDs are assigned by the database so concurrent intakes can't collide.
+_PET_ID_DEFAULT = "('PET-' || upper(substr(replace(gen_random_uuid()::text, '-', ''), 1, 10)))"
+_CREATE_TABLE_SQL = f"""
+    CREATE TABLE IF NOT EXISTS {_QTABLE} (
+        id SERIAL PRIMARY KEY,
+        full_name TEXT NOT NULL,
+        Pet_id TEXT DEFAULT {_PET_ID_DEFAULT},
+        date_of_birth DATE NOT NULL,
+        phone TEXT,
+        email TEXT,
+        address TEXT,
+        visit_date DATE,
+        department TEXT,
+        symptoms TEXT,
+        allergies TEXT,
+        additional_notes TEXT,
+        created_at TIMESTAMPTZ DEFAULT NOW()
+    );
+"""
+_PET_ID_DEFAULT_SQL = f"""
+    ALTER TABLE {_QTABLE}
+    ALTER COLUMN Pet_id SET DEFAULT {_PET_ID_DEFAULT};
+"""
+_CREATE_PET_ID_INDEX_SQL = f"""
+    CREATE UNIQUE INDEX IF NOT EXISTS {TABLE_NAME}_pet_id_idx
+    ON {_QTABLE} (Pet_id);
+"""
+# id breaks ties between rows created in the same instant, so pages are stable and
+# the list query is a plain index scan. Supersedes the single-column index.
+_CREATE_INDEX_SQL = f"""
+    CREATE INDEX IF NOT EXISTS {TABLE_NAME}_created_at_id_idx
+    ON {_QTABLE} (created_at DESC, id DESC);
+"""
+_DROP_OLD_INDEX_SQL = sql.SQL("DROP INDEX IF EXISTS {index}").format(
+    index=sql.Identifier(SCHEMA_NAME, f"{TABLE_NAME}_created_at_idx"),
+).as_string()
+
+# DML is composed with psycopg.sql, with columns taken from the field tuples,
+# and rendered once at import. The hot path reuses identical query strings (and
+# psycopg's cached parse of their placeholders) instead of rebuilding SQL per call.
+_INTAKE_COLUMNS = sql.SQL(", ").join(map(sql.Identifier, INTAKE_FIELDS))
+
+_INSERT_SQL = sql.SQL(
+    "INSERT INTO {table} ({columns}) VALUES ({values}) RETURNING id, created_at, pet_id"
+).format(
+    table=_TABLE,
+    columns=_INTAKE_COLUMNS,
+    values=sql.SQL(", ").join(map(sql.Placeholder, INTAKE_FIELDS)),
+).as_string()
+
+_COPY_SQL = sql.SQL("COPY {table} ({columns}) FROM STDIN").format(
+    table=_TABLE,
+    columns=_INTAKE_COLUMNS,
+).as_string()
+
+_SELECT_SQL = sql.SQL(
+    "SELECT {columns} FROM {table} ORDER BY created_at DESC, id DESC LIMIT %(lim)s OFFSET %(off)s"
+).format(
+    table=_TABLE,
+    columns=sql.SQL(", ").join(map(sql.Identifier, RECORD_COLUMNS)),
+).as_string()
+
+_DELETE_SQL = sql.SQL("DELETE FROM {table} WHERE id = ANY(%(ids)s)").format(
+    table=_TABLE,
+).as_string()
 
 
 def _create_schema_and_table() -> None:
-    conn = _get_connection()
-    conn.rollback()  # Clear any failed transaction state
-    create_table_sql = f"""
-        CREATE TABLE IF NOT EXISTS {_qualified_table_name()} (
-            id SERIAL PRIMARY KEY,
-            full_name TEXT NOT NULL,
-            Pet_id TEXT,
-            date_of_birth DATE NOT NULL,
-            phone TEXT,
-            email TEXT,
-            address TEXT,
-            visit_date DATE,
-            department TEXT,
-            symptoms TEXT,
-            allergies TEXT,
-            additional_notes TEXT,
-            created_at TIMESTAMPTZ DEFAULT NOW()
-        );
+    """Bootstrap the table over a direct connection; runs once per process before the pool is created."""
+    with _LakebaseConnection.connect(**_CONNECT_KWARGS, port=DB_PORT) as conn, conn.cursor() as cur:
+        cur.execute(_CREATE_TABLE_SQL)
+        cur.execute(_PET_ID_DEFAULT_SQL)
+        cur.execute(_CREATE_PET_ID_INDEX_SQL)
+        cur.execute(_CREATE_INDEX_SQL)
+        cur.execute(_DROP_OLD_INDEX_SQL)
+
+
+def _records_frame(cur: psycopg.Cursor) -> pd.DataFrame:
+    columns = [desc[0] for desc in cur.description]
+    return pd.DataFrame(cur.fetchall(), columns=columns)
+
+
+def insert_Pet_intake(payload: dict) -> tuple[dict, tuple[int, int]]:
+    """Insert one intake; return its server-assigned fields and the write counter before/after."""
+    with _get_pool().connection() as conn:
+        # Pipeline mode sends BEGIN, INSERT and COMMIT in a single network flush
+        with conn.pipeline(), conn.cursor() as cur:
+            # Prepare on first use so later submits on this connection skip parse/plan
+            cur.execute(_INSERT_SQL, payload, prepare=PREPARE_STATEMENTS)
+            conn.commit()
+            row_id, created_at, pet_id = cur.fetchone()
+    inserted = {"id": row_id, "created_at": created_at, "pet_id": pet_id}
+    return inserted, _note_records_written()
+
+
+def insert_Pet_intakes_bulk(df: pd.DataFrame) -> None:
+    """Load many intakes in one transaction with COPY FROM STDIN."""
+    with _get_pool().connection() as conn, conn.cursor() as cur:
+        with cur.copy(_COPY_SQL) as copy:
+            for row in df.itertuples(index=False):
+                copy.write_row(row)
+    _note_records_written()
+
+
+def _intakes_from_csv(df: pd.DataFrame) -> pd.DataFrame:
+    """Align uploaded CSV columns with the intake fields, turning blank cells into NULL.
+
+    Expects the CSV read as text (``dtype=str, keep_default_na=False``) so values
+    like phone numbers reach Postgres unchanged and DATE columns are parsed there.
+    Whitespace-only cells count as blank, matching the form's required-field check.
     """
+    missing_columns = [col for col in REQUIRED_CSV_COLUMNS if col not in df.columns]
+    if missing_columns:
+        raise ValueError("CSV is missing required columns: " + ", ".join(missing_columns))
+
+    df = df.reindex(columns=list(INTAKE_FIELDS), fill_value="").astype(object)
+    blank = df.apply(lambda col: col.str.strip().eq(""))
+
+    # Line numbers count the header as line 1
+    bad_rows = [
+        f"line {position + 2} ({', '.join(col for col in REQUIRED_CSV_COLUMNS if row[col])})"
+        for position, (_, row) in enumerate(blank.iterrows())
+        if row[list(REQUIRED_CSV_COLUMNS)].any()
+    ]
+    if bad_rows:
+        raise ValueError("CSV rows are missing required values: " + "; ".join(bad_rows))
+
+    return df.where(~blank, None)
+
+
+def _query_records_page(page: int) -> pd.DataFrame:
+    with _get_pool().connection() as conn, conn.cursor() as cur:
+        cur.execute(
+            _SELECT_SQL,
+            {"lim": PAGE_SIZE, "off": (page - 1) * PAGE_SIZE},
+            prepare=PREPARE_STATEMENTS,
+        )
+        return _records_frame(cur)
 
-    with conn.cursor() as cur:
-        cur.execute(create_table_sql)
-    conn.commit()
 
+@st.cache_data(ttl=RECORDS_TTL_SECONDS, show_spinner=False)
+def fetch_Pet_records(page: int = 1) -> pd.DataFrame:
+    """List one page of intake records; cached briefly since most reruns don't change the table."""
+    return _query_records_page(page)
 
-def insert_Pet_intake(payload: dict) -> None:
-    conn = _get_connection()
-    _create_schema_and_table()
 
-    insert_sql = f"""
-        INSERT INTO {_qualified_table_name()} (
-            full_name,
-            Pet_id,
-            date_of_birth,
-            phone,
-            email,
-            address,
-            visit_date,
-            department,
-            symptoms,
-            allergies,
-            additional_notes
-        ) VALUES (
-            %(full_name)s,
-            %(Pet_id)s,
-            %(date_of_birth)s,
-            %(phone)s,
-            %(email)s,
-            %(address)s,
-            %(visit_date)s,
-            %(department)s,
-            %(symptoms)s,
-            %(allergies)s,
-            %(additional_notes)s
-        );
-    """
+@st.cache_resource(show_spinner=False)
+def _records_version() -> dict:
+    """Process-wide count of writes to the table, shared by every session."""
+    return {"value": 0, "lock": threading.Lock()}
 
-    with conn.cursor() as cur:
-        cur.execute(insert_sql, payload)
-    conn.commit()
 
+def _note_records_written() -> tuple[int, int]:
+    """Invalidate cached pages and return the write counter before and after this write."""
+    fetch_Pet_records.clear()
+    version = _records_version()
+    with version["lock"]:
+        previous = version["value"]
+        version["value"] = previous + 1
+    return previous, previous + 1
 
-def fetch_Pet_records() -> list[dict]:
-    conn = _get_connection()
-    _create_schema_and_table()
 
-    select_sql = f"""
-        SELECT
-            id,
-            full_name,
-            Pet_id,
-            date_of_birth,
-            phone,
-            email,
-            address,
-            visit_date,
-            department,
-            symptoms,
-            allergies,
-            additional_notes,
-            created_at
-        FROM {_qualified_table_name()}
-        ORDER BY created_at DESC;
-    """
+def _first_page_from_session() -> pd.DataFrame:
+    """Serve page one from this session's copy.
 
-    with conn.cursor() as cur:
-        cur.execute(select_sql)
-        columns = [desc[0] for desc in cur.description]
-        rows = cur.fetchall()
-    
-    return [dict(zip(columns, row)) for row in rows]
+    The copy is re-read straight from the database (not the shared cache) once it
+    is older than RECORDS_TTL_SECONDS or any session has written since it was read.
+    """
+    cached = st.session_state.get("records_cache")
+    version = _records_version()["value"]
+    if (
+        cached is None
+        or cached["version"] != version
+        or time.monotonic() - cached["fetched_at"] > RECORDS_TTL_SECONDS
+    ):
+        cached = {
+            "df": _query_records_page(1),
+            "fetched_at": time.monotonic(),
+            "version": version,
+        }
+        st.session_state["records_cache"] = cached
+    return cached["df"]
+
+
+def _prepend_to_session_records(record: dict, previous: int, current: int) -> None:
+    """Show a just-inserted row on page one without querying the table again.
+
+    Only safe when no other write landed since the copy was read; otherwise the
+    copy is dropped and re-read on the next render.
+    """
+    cached = st.session_state.get("records_cache")
+    if cached is None:
+        return
+    if cached["version"] != previous:
+        st.session_state.pop("records_cache", None)
+        return
+    new_row = pd.DataFrame([record], columns=cached["df"].columns)
+    if not cached["df"].empty:
+        new_row = pd.concat([new_row, cached["df"]], ignore_index=True)
+    cached["df"] = new_row.head(PAGE_SIZE)
+    cached["version"] = current
 
 
 def delete_Pet_records(record_ids: list[int]) -> None:
     """Delete pet records by their IDs."""
-    conn = _get_connection()
-    
-    delete_sql = f"""
-        DELETE FROM {_qualified_table_name()}
-        WHERE id = ANY(%(ids)s);
-    """
-    
-    with conn.cursor() as cur:
-        cur.execute(delete_sql, {"ids": record_ids})
-    conn.commit()
+    with _get_pool().connection() as conn, conn.cursor() as cur:
+        cur.execute(_DELETE_SQL, {"ids": record_ids})
+    _note_records_written()
 
 
 def main() -> None:
@@ -165,9 +328,7 @@ def main() -> None:
         with st.form("Pet_intake_form"):
             st.subheader("Pet Details")
             full_name = st.text_input("Full name", placeholder="Jane Doe")
-            if "pet_id" not in st.session_state:
-                st.session_state["pet_id"] = _generate_pet_id()
-            pet_id = st.text_input("Pet ID", value=st.session_state["pet_id"], disabled=True)
+            st.text_input("Pet ID", placeholder="Assigned on submit", disabled=True)
             date_of_birth = st.date_input(
                 "Date of birth",
                 value=datetime.date(1990, 1, 1),
@@ -207,11 +368,14 @@ def main() -> None:
             submitted = st.form_submit_button("Submit intake form")
 
         if submitted:
-            missing_fields = []
-            if not full_name.strip():
-                missing_fields.append("Full name")
-            if date_of_birth is None:
-                missing_fields.append("Date of birth")
+            missing_fields = [
+                label
+                for label, ok in (
+                    ("Full name", bool(full_name) and not full_name.isspace()),
+                    ("Date of birth", date_of_birth is not None),
+                )
+                if not ok
+            ]
             if missing_fields:
                 st.error(
                     "Please complete the required fields: "
@@ -222,7 +386,6 @@ def main() -> None:
 
             payload = {
                 "full_name": full_name,
-                "Pet_id": pet_id,
                 "date_of_birth": date_of_birth,
                 "phone": pet_owner_phone,
                 "email": pet_owner_email,
@@ -235,26 +398,46 @@ def main() -> None:
             }
 
             try:
-                insert_Pet_intake(payload)
+                inserted, versions = insert_Pet_intake(payload)
             except Exception as exc:  # noqa: BLE001
                 st.error(f"Submission failed: {exc}")
                 return
 
-            st.success("Pet intake form submitted to Lakebase.")
-            st.write(payload)
-            st.session_state["pet_id"] = _generate_pet_id()
+            _prepend_to_session_records({**payload, **inserted}, *versions)
+            st.success(
+                f"Pet intake form submitted to Lakebase. Pet ID: {inserted['pet_id']}"
+            )
+            st.write({**inserted, **payload})
+
+        with st.expander("Bulk upload from CSV"):
+            st.caption(
+                "Columns: " + ", ".join(INTAKE_FIELDS)
+                + ". Only full_name and date_of_birth are required."
+            )
+            uploaded_csv = st.file_uploader("Intake CSV", type="csv")
+            if uploaded_csv is not None and st.button("Import intakes"):
+                try:
+                    intakes = _intakes_from_csv(
+                        pd.read_csv(uploaded_csv, dtype=str, keep_default_na=False)
+                    )
+                    insert_Pet_intakes_bulk(intakes)
+                except Exception as exc:  # noqa: BLE001
+                    st.error(f"Import failed: {exc}")
+                else:
+                    st.success(f"Imported {len(intakes)} Pet intake(s) to Lakebase.")
 
     with records_tab:
         st.subheader("Pet Records")
+        page = st.number_input("Page", min_value=1, step=1, key="page")
         try:
-            records = fetch_Pet_records()
+            records = _first_page_from_session() if page == 1 else fetch_Pet_records(int(page))
         except Exception as exc:  # noqa: BLE001
             st.error(f"Unable to load records: {exc}")
             return
 
-        if records:
-            df = pd.DataFrame(records)
-            
+        if not records.empty:
+            df = records
+
             # Use data_editor with selection enabled
             edited_df = st.data_editor(
                 df,
@@ -280,6 +463,8 @@ def main() -> None:
                         st.rerun()
                     except Exception as exc:  # noqa: BLE001
                         st.error(f"Delete failed: {exc}")
+        elif page > 1:
+            st.info("No Pet records on this page.")
         else:
             st.info("No Pet records found yet.")
 